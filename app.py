@@ -1,16 +1,27 @@
 import os
+import re
 import uuid
 import random
 import smtplib
 import ssl
+import queue
+import atexit
+import threading
+import time
+from contextlib import contextmanager
+from functools import lru_cache
+from concurrent.futures import ThreadPoolExecutor
 from email.message import EmailMessage
 from datetime import datetime
-from flask import Flask, render_template, request, redirect, session, url_for, flash
-from pymongo import MongoClient
+from flask import Flask, render_template, stream_template, request, redirect, session, url_for, flash
+from flask_caching import Cache
+from pymongo import MongoClient, UpdateOne, UpdateMany
+from pymongo.errors import OperationFailure
 from werkzeug.security import generate_password_hash, check_password_hash
 from werkzeug.utils import secure_filename
 from bson import ObjectId
 from geopy.geocoders import Nominatim
+from geopy.adapters import RequestsAdapter
 from urllib.parse import quote_plus
 
 app = Flask(__name__)
@@ -19,27 +30,152 @@ app.secret_key = os.environ.get("FLASK_SECRET", "replace_with_a_strong_secret")
 UPLOAD_FOLDER = os.path.join(app.root_path, 'static', 'uploads')
 ALLOWED_EXTENSIONS = {"png", "jpg", "jpeg", "gif"}
 app.config["UPLOAD_FOLDER"] = UPLOAD_FOLDER
+# Copy buffer for saving uploads (FileStorage.save defaults to 16 KiB)
+UPLOAD_CHUNK_SIZE = 1 << 20
+
+# Pinned password hashing parameters; tune PASSWORD_HASH_METHOD for the host
+# (e.g. "scrypt:16384:8:1"). Existing hashes keep verifying since the method is
+# stored in each hash.
+PASSWORD_HASH_METHOD = os.environ.get("PASSWORD_HASH_METHOD", "scrypt:32768:8:1")
+
+# Short-lived cache for property search results, shared by all workers through
+# Redis so invalidation reaches every process. CACHE_TYPE=SimpleCache is only
+# suitable for a single worker: delete_memoized then clears just that process
+# and other workers may serve stale results for up to the 30s timeout.
+cache = Cache(app, config={
+    "CACHE_TYPE": os.environ.get("CACHE_TYPE", "RedisCache"),
+    "CACHE_REDIS_URL": os.environ.get("CACHE_REDIS_URL", "redis://localhost:6379/0"),
+    "CACHE_DEFAULT_TIMEOUT": 30
+})
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 
 # MongoDB client (adjust URI if needed)
-client = MongoClient(os.environ.get("MONGODB_URI", "mongodb://localhost:27017/"))
+# Pool sizing can be tuned with MONGO_MAX_POOL / MONGO_MIN_POOL.
+# connect=False defers opening sockets until first use so forking WSGI
+# servers (gunicorn etc.) don't share connections inherited from the parent.
+client = MongoClient(
+    os.environ.get("MONGODB_URI", "mongodb://localhost:27017/"),
+    maxPoolSize=int(os.environ.get("MONGO_MAX_POOL", "200")),
+    minPoolSize=int(os.environ.get("MONGO_MIN_POOL", "10")),
+    maxIdleTimeMS=300_000,
+    waitQueueTimeoutMS=5000,
+    serverSelectionTimeoutMS=3000,
+    retryWrites=True,
+    connect=False
+)
 db = client["rental_db"]
 users_col = db["users"]
 props_col = db["properties"]
 bookings_col = db["bookings"]
 notifications_col = db["notifications"]
+geocache_col = db["geocache"]
 
-geolocator = Nominatim(user_agent="rental_app")
+# RequestsAdapter keeps a requests.Session, so repeated lookups reuse the connection
+geolocator = Nominatim(user_agent="rental_app", adapter_factory=RequestsAdapter)
+
+# Background worker for outgoing email so SMTP round-trips don't block requests
+email_executor = ThreadPoolExecutor(
+    max_workers=int(os.environ.get("EMAIL_WORKERS", "2")),
+    thread_name_prefix="email"
+)
+
+# Worker pool for running independent Mongo queries of one request concurrently.
+# run_parallel offloads at most 2 calls per request (the last runs inline), so
+# size it to 2x the WSGI server's threads per process: set WSGI_THREADS to
+# match (e.g. gunicorn --threads), or override DB_WORKERS directly.
+WSGI_THREADS = int(os.environ.get("WSGI_THREADS", "8"))
+db_executor = ThreadPoolExecutor(
+    max_workers=int(os.environ.get("DB_WORKERS", str(2 * WSGI_THREADS))),
+    thread_name_prefix="db"
+)
+
+
+def run_parallel(*calls):
+    """
+    Run zero-argument callables concurrently and return their results in order.
+    All but the last run on db_executor, outside the request context, so read
+    anything needed from `session`/`request` before building them; the last
+    runs on the request thread instead of idling while it waits.
+    """
+    futures = [db_executor.submit(c) for c in calls[:-1]]
+    last = calls[-1]() if calls else None
+    return [f.result() for f in futures] + ([last] if calls else [])
+
+
+def location_tokens(location):
+    """Lowercased words of a location, e.g. "MG Road, Bangalore" -> ["mg", "road", "bangalore"]."""
+    return re.findall(r"\w+", (location or "").lower())
+
+
+def normalize_address(address):
+    return " ".join((address or "").lower().split())
+
+
+# Nominatim usage policy: at most one request per second
+NOMINATIM_MIN_DELAY = 1.0
+_nominatim_lock = threading.Lock()
+_nominatim_last_call = 0.0
+
+
+def nominatim_geocode(query):
+    """geolocator.geocode, with calls spaced NOMINATIM_MIN_DELAY apart across threads."""
+    global _nominatim_last_call
+    with _nominatim_lock:
+        wait = _nominatim_last_call + NOMINATIM_MIN_DELAY - time.monotonic()
+        if wait > 0:
+            time.sleep(wait)
+        _nominatim_last_call = time.monotonic()
+    return geolocator.geocode(query, timeout=10)
+
+
+@lru_cache(maxsize=1024)
+def _geocode_cached(key):
+    """
+    Geocode a normalized address, checking the persistent geocache first.
+    Errors propagate so failed lookups are not memoized.
+    """
+    cached = geocache_col.find_one({"_id": key})
+    if cached:
+        return cached["lat"], cached["lon"]
+    location = nominatim_geocode(key)
+    if not location:
+        return None, None
+    geocache_col.update_one(
+        {"_id": key},
+        {"$set": {"lat": location.latitude, "lon": location.longitude, "updated_at": datetime.utcnow()}},
+        upsert=True
+    )
+    return location.latitude, location.longitude
 
 
 def get_lat_lon(address):
+    key = normalize_address(address)
+    if not key:
+        return None, None
     try:
-        location = geolocator.geocode(address, timeout=10)
-        if location:
-            return location.latitude, location.longitude
+        return _geocode_cached(key)
+    except Exception:
+        return None, None
+
+
+def get_lat_lon_batch(addresses):
+    """
+    Geocode many addresses, returning (lat, lon) tuples in input order.
+    Duplicates are resolved once, cached ones come from a single geocache
+    query, and only real Nominatim requests are rate-limited (see nominatim_geocode).
+    """
+    keys = [normalize_address(a) for a in addresses]
+    unique = [k for k in dict.fromkeys(keys) if k]
+    results = {"": (None, None)}
+    try:
+        for doc in geocache_col.find({"_id": {"$in": unique}}):
+            results[doc["_id"]] = (doc["lat"], doc["lon"])
     except Exception:
         pass
-    return None, None
+    misses = [k for k in unique if k not in results]
+    for key in misses:
+        results[key] = get_lat_lon(key)
+    return [results[k] for k in keys]
 
 
 def is_logged_in():
@@ -59,13 +195,123 @@ def save_file(file):
     if file and allowed_file(file.filename):
         orig_name = secure_filename(file.filename)
         unique_name = f"{uuid.uuid4().hex}_{orig_name}"
-        file.save(os.path.join(app.config["UPLOAD_FOLDER"], unique_name))
+        file.save(os.path.join(app.config["UPLOAD_FOLDER"], unique_name), buffer_size=UPLOAD_CHUNK_SIZE)
         return unique_name
     return None
 
 
 # ------------------ Email helper ------------------
 
+SMTP_POOL_MAX = int(os.environ.get("SMTP_POOL_MAX", "4"))
+
+
+class SMTPPool:
+    """
+    Keeps up to max_size authenticated SMTP connections open and reuses them,
+    so each email doesn't pay for a new connect + TLS handshake + login.
+    """
+
+    def __init__(self, host, port, user, password, max_size=SMTP_POOL_MAX):
+        self.host = host
+        self.port = port
+        self.user = user
+        self.password = password
+        self.max_size = max_size
+        self._idle = queue.Queue()
+        self._lock = threading.Lock()
+        self._created = 0
+
+    def _connect(self):
+        # SSL vs TLS: port 465 = SSL, else use STARTTLS
+        if self.port == 465:
+            server = smtplib.SMTP_SSL(self.host, self.port, context=ssl.create_default_context())
+        else:
+            server = smtplib.SMTP(self.host, self.port)
+            server.ehlo()
+            server.starttls(context=ssl.create_default_context())
+        server.login(self.user, self.password)
+        return server
+
+    def _new_connection(self):
+        """Open a connection for a slot already reserved in _created."""
+        try:
+            return self._connect()
+        except Exception:
+            with self._lock:
+                self._created -= 1
+            raise
+
+    @staticmethod
+    def _is_alive(server):
+        try:
+            return server.noop()[0] == 250
+        except (smtplib.SMTPException, OSError):
+            return False
+
+    @staticmethod
+    def _close(server):
+        try:
+            server.quit()
+        except Exception:
+            pass
+
+    def _checkout(self):
+        try:
+            server = self._idle.get_nowait()
+        except queue.Empty:
+            with self._lock:
+                can_create = self._created < self.max_size
+                if can_create:
+                    self._created += 1
+            if can_create:
+                return self._new_connection()
+            server = self._idle.get(timeout=30)
+
+        if self._is_alive(server):
+            return server
+        # stale connection (server timed it out) -> reconnect in the same slot
+        self._close(server)
+        return self._new_connection()
+
+    @contextmanager
+    def acquire(self):
+        server = self._checkout()
+        try:
+            yield server
+        except Exception:
+            # connection state is unknown after a failure; don't reuse it
+            self._close(server)
+            with self._lock:
+                self._created -= 1
+            raise
+        else:
+            self._idle.put(server)
+
+    def close_all(self):
+        while True:
+            try:
+                server = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            self._close(server)
+            with self._lock:
+                self._created -= 1
+
+
+_smtp_pool = None
+_smtp_pool_lock = threading.Lock()
+
+
+def get_smtp_pool(host, port, user, password):
+    """Return the shared SMTP pool, creating it on first use."""
+    global _smtp_pool
+    with _smtp_pool_lock:
+        if _smtp_pool is None:
+            _smtp_pool = SMTPPool(host, port, user, password)
+            atexit.register(_smtp_pool.close_all)
+        return _smtp_pool
+
+
 def send_email(to_email: str, subject: str, body: str):
     """
     Send an email using SMTP settings from environment variables.
@@ -95,18 +341,9 @@ def send_email(to_email: str, subject: str, body: str):
         msg["Subject"] = subject
         msg.set_content(body)
 
-        # SSL vs TLS: port 465 = SSL, else use STARTTLS
-        if smtp_port == 465:
-            context = ssl.create_default_context()
-            with smtplib.SMTP_SSL(smtp_host, smtp_port, context=context) as server:
-                server.login(smtp_user, smtp_pass)
-                server.send_message(msg)
-        else:
-            with smtplib.SMTP(smtp_host, smtp_port) as server:
-                server.ehlo()
-                server.starttls(context=ssl.create_default_context())
-                server.login(smtp_user, smtp_pass)
-                server.send_message(msg)
+        pool = get_smtp_pool(smtp_host, smtp_port, smtp_user, smtp_pass)
+        with pool.acquire() as server:
+            server.send_message(msg)
     except Exception as e:
         # Never crash the app for email errors; just log
         print("Failed to send email:", e)
@@ -114,21 +351,75 @@ def send_email(to_email: str, subject: str, body: str):
         print(f"To: {to_email}\nSubject: {subject}\n{body}")
 
 
+def send_email_async(to_email: str, subject: str, body: str):
+    """Queue an email on the background worker and return immediately."""
+    email_executor.submit(send_email, to_email, subject, body)
+
+
 # ------------------ Helpers for reviews ------------------
 
 def compute_avg_rating(reviews):
     """Return average rating (rounded to 2 decimals) or None if no reviews."""
-    if not reviews:
-        return None
-    total = 0.0
-    count = 0
-    for r in reviews:
-        try:
-            total += float(r.get("rating", 0))
-            count += 1
-        except Exception:
-            pass
-    return round(total / count, 2) if count else None
+    # add_review always stores ratings as floats, so no per-item conversion needed
+    ratings = [r["rating"] for r in reviews or () if "rating" in r]
+    return round(sum(ratings) / len(ratings), 2) if ratings else None
+
+
+def stored_avg_rating(prop):
+    """
+    Return the avg_rating cached on the property document by add_review,
+    computing it only for documents written before the field existed.
+    """
+    if "avg_rating" in prop:
+        return prop["avg_rating"]
+    return compute_avg_rating(prop.get("reviews", []))
+
+
+def stored_review_count(prop):
+    """Return the cached review_count, counting reviews for older documents."""
+    if "review_count" in prop:
+        return prop["review_count"]
+    return len(prop.get("reviews", []))
+
+
+def drop_cached_reviews():
+    """
+    $set stage removing `reviews` from documents that already carry the cached
+    review_count/avg_rating, so list views don't transfer the review arrays.
+    """
+    return {"$set": {"reviews": {"$cond": [
+        {"$eq": [{"$type": "$review_count"}, "missing"]}, "$reviews", "$$REMOVE"
+    ]}}}
+
+
+def recipients(*emails):
+    """Distinct, non-empty emails for a notification's `for_email` field."""
+    return list(dict.fromkeys(e for e in emails if e))
+
+
+def approved_booking_lookup():
+    """$lookup stage attaching the property's APPROVED booking (if any) as `approved`."""
+    return {"$lookup": {
+        "from": bookings_col.name,
+        "let": {"pid": "$_id"},
+        "pipeline": [
+            {"$match": {"$expr": {"$and": [
+                {"$eq": ["$property_id", "$$pid"]},
+                {"$eq": ["$status", "APPROVED"]}
+            ]}}},
+            {"$limit": 1},
+            {"$project": {"tenant_email": 1}}
+        ],
+        "as": "approved"
+    }}
+
+
+@app.template_filter("fmt_dt")
+def fmt_dt(dt):
+    """Format a datetime for display; other values are shown as-is."""
+    if isinstance(dt, datetime):
+        return dt.strftime("%Y-%m-%d %H:%M")
+    return dt or ""
 
 
 # ------------------ ROUTES ------------------
@@ -155,7 +446,7 @@ def register():
         users_col.insert_one({
             "name": name,
             "email": email,
-            "password": generate_password_hash(password),
+            "password": generate_password_hash(password, method=PASSWORD_HASH_METHOD),
             "role": role
         })
         return redirect(url_for("login"))
@@ -187,30 +478,43 @@ def logout():
 # ------------------ OWNER DASHBOARD ------------------
 
 
+def iter_owner_props(cursor):
+    """Yield the owner's properties from cursor, prepared for the dashboard."""
+    for p in cursor:
+        p["_id"] = str(p["_id"])
+        p["images"] = p.get("images", [])  # Always a list
+        p["avg_rating"] = stored_avg_rating(p)
+        p["review_count"] = stored_review_count(p)
+        # booking summary
+        approved = p.pop("approved", [])
+        p["booked"] = bool(approved)
+        p["booked_by"] = approved[0]["tenant_email"] if approved else None
+        yield p
+
+
 @app.route("/owner/dashboard")
 def owner_dashboard():
     if not is_logged_in() or not role_is("owner"):
         return redirect(url_for("login"))
 
     owner_email = session["user_email"]
-    my_props = list(props_col.find({"owner_email": owner_email}))
-    for p in my_props:
-        p["_id"] = str(p["_id"])
-        p["images"] = p.get("images", [])  # Always a list
-        # reviews if present
-        p["reviews"] = p.get("reviews", [])
-        p["avg_rating"] = compute_avg_rating(p["reviews"])
-        # booking summary
-        approved = bookings_col.find_one({"property_id": ObjectId(p["_id"]), "status": "APPROVED"})
-        p["booked"] = bool(approved)
-        p["booked_by"] = approved["tenant_email"] if approved else None
-
-    # show recent notifications (owner)
-    notifications = list(notifications_col.find({"owner_email": owner_email}).sort("timestamp", -1).limit(10))
+    my_props, notifications = run_parallel(
+        lambda: props_col.aggregate([
+            {"$match": {"owner_email": owner_email}},
+            drop_cached_reviews(),
+            approved_booking_lookup()
+        ], batchSize=50),
+        # recent notifications (owner)
+        lambda: list(notifications_col.find(
+            {"owner_email": owner_email}, {"message": 1, "timestamp": 1, "read": 1}
+        ).sort("timestamp", -1).limit(10))
+    )
     for n in notifications:
         n["_id"] = str(n["_id"])
-        n["timestamp_str"] = n["timestamp"].strftime("%Y-%m-%d %H:%M")
-    return render_template("owner_dashboard.html", properties=my_props, notifications=notifications)
+    # properties are enriched lazily while the page streams out
+    return app.response_class(stream_template(
+        "owner_dashboard.html", properties=iter_owner_props(my_props), notifications=notifications
+    ))
 
 
 @app.route("/owner/add", methods=["GET", "POST"])
@@ -244,6 +548,7 @@ def owner_add():
             "title": title,
             "description": description,
             "location": location,
+            "location_tokens": location_tokens(location),
             "latitude": lat,
             "longitude": lon,
             "price": price_val,
@@ -251,9 +556,12 @@ def owner_add():
             "owner_email": session["user_email"],
             "images": images_list,
             "reviews": [],          # initialize reviews list
+            "avg_rating": None,
+            "review_count": 0,
             "fake": False,
             "created_at": datetime.utcnow()
         })
+        invalidate_search_cache()
         return redirect(url_for("owner_dashboard"))
 
     return render_template("add_property.html")
@@ -264,7 +572,8 @@ def edit_property(property_id):
     if not is_logged_in() or not role_is("owner"):
         return redirect(url_for("login"))
 
-    prop = props_col.find_one({"_id": ObjectId(property_id), "owner_email": session["user_email"]})
+    oid = ObjectId(property_id)
+    prop = props_col.find_one({"_id": oid, "owner_email": session["user_email"]})
     if not prop:
         return redirect(url_for("owner_dashboard"))
 
@@ -281,6 +590,7 @@ def edit_property(property_id):
             "title": title if title else prop["title"],
             "description": description if description else prop.get("description", ""),
             "location": location if location else prop["location"],
+            "location_tokens": location_tokens(location if location else prop["location"]),
             "latitude": lat if lat else prop.get("latitude"),
             "longitude": lon if lon else prop.get("longitude"),
             "price": float(price) if price else prop["price"],
@@ -296,7 +606,8 @@ def edit_property(property_id):
                 if filename:
                     update_data["images"].append(filename)
 
-        props_col.update_one({"_id": ObjectId(property_id)}, {"$set": update_data})
+        props_col.update_one({"_id": oid}, {"$set": update_data})
+        invalidate_search_cache()
         return redirect(url_for("owner_dashboard"))
 
     prop["images"] = prop.get("images", [])
@@ -308,32 +619,41 @@ def edit_property(property_id):
 def owner_delete(prop_id):
     if not is_logged_in() or not role_is("owner"):
         return redirect(url_for("login"))
-    props_col.delete_one({"_id": ObjectId(prop_id), "owner_email": session["user_email"]})
-    # Also remove related bookings and notifications (safe cleanup)
+    oid = ObjectId(prop_id)
+    owner_email = session["user_email"]
+
+    def delete_with_related(s=None):
+        res = props_col.delete_one({"_id": oid, "owner_email": owner_email}, session=s)
+        # Also remove related bookings and notifications, only if the owner's property was deleted
+        if res.deleted_count:
+            bookings_col.delete_many({"property_id": oid}, session=s)
+            notifications_col.delete_many({"property_id": oid}, session=s)
+
     try:
-        bookings_col.delete_many({"property_id": ObjectId(prop_id)})
-        notifications_col.delete_many({"property_id": ObjectId(prop_id)})
-    except Exception:
-        pass
+        with client.start_session() as s:
+            s.with_transaction(delete_with_related)
+    except OperationFailure as e:
+        # IllegalOperation: standalone server without transaction support
+        if e.code != 20:
+            raise
+        delete_with_related()
+    invalidate_search_cache()
     return redirect(url_for("owner_dashboard"))
 
 
 # ------------------ TENANT DASHBOARD ------------------
 
 
-@app.route("/tenant/dashboard")
-def tenant_dashboard():
-    if not is_logged_in() or not role_is("tenant"):
-        return redirect(url_for("login"))
-
-    location = request.args.get("location", "").strip()
-    min_price = request.args.get("min_price", "").strip()
-    max_price = request.args.get("max_price", "").strip()
-    rooms = request.args.get("rooms", "").strip()
-
+@cache.memoize(timeout=30)
+def search_properties(location, min_price, max_price, rooms):
+    """Properties matching the tenant dashboard filters, enriched for display."""
     query = {}
     if location:
-        query["location"] = {"$regex": location, "$options": "i"}
+        # every search word must prefix-match a word of the location; anchored
+        # regexes on the multikey location_tokens index avoid a collection scan
+        words = location_tokens(location)
+        if words:
+            query["location_tokens"] = {"$all": [re.compile("^" + re.escape(w)) for w in words]}
 
     price_q = {}
     try:
@@ -352,27 +672,52 @@ def tenant_dashboard():
         except ValueError:
             pass
 
-    found = list(props_col.find(query))
+    found = list(props_col.aggregate([{"$match": query}, drop_cached_reviews(), approved_booking_lookup()]))
     for p in found:
         p["_id"] = str(p["_id"])
         p["images"] = p.get("images", [])
-        p["reviews"] = p.get("reviews", [])
-        p["avg_rating"] = compute_avg_rating(p["reviews"])
+        p["avg_rating"] = stored_avg_rating(p)
+        p["review_count"] = stored_review_count(p)
+        p.pop("reviews", None)
         if "location" in p and p["location"]:
             p["map_url"] = "https://www.google.com/maps/search/?api=1&query=" + quote_plus(p["location"])
         else:
             p["map_url"] = "#"
         # booking status
-        approved = bookings_col.find_one({"property_id": ObjectId(p["_id"]), "status": "APPROVED"})
+        approved = p.pop("approved", [])
         p["booked"] = bool(approved)
-        p["booked_by"] = approved["tenant_email"] if approved else None
+        p["booked_by"] = approved[0]["tenant_email"] if approved else None
+    return found
+
+
+def invalidate_search_cache():
+    """
+    Drop cached search results after listings or their booking state change.
+    With the default RedisCache this applies to every worker; with an
+    in-process cache it only clears the current process.
+    """
+    cache.delete_memoized(search_properties)
+
+
+@app.route("/tenant/dashboard")
+def tenant_dashboard():
+    if not is_logged_in() or not role_is("tenant"):
+        return redirect(url_for("login"))
+
+    location = request.args.get("location", "").strip()
+    min_price = request.args.get("min_price", "").strip()
+    max_price = request.args.get("max_price", "").strip()
+    rooms = request.args.get("rooms", "").strip()
+
+    found = search_properties(location, min_price, max_price, rooms)
 
     # tenant's bookings
-    my_bookings = list(bookings_col.find({"tenant_email": session["user_email"]}).sort("created_at", -1))
+    my_bookings = list(bookings_col.find(
+        {"tenant_email": session["user_email"]}, {"property_id": 1, "status": 1, "created_at": 1}
+    ).sort("created_at", -1))
     for b in my_bookings:
         b["_id"] = str(b["_id"])
         b["property_id_str"] = str(b["property_id"])
-        b["created_at_str"] = b["created_at"].strftime("%Y-%m-%d %H:%M")
 
     filters = {"location": location, "min_price": min_price, "max_price": max_price, "rooms": rooms}
     return render_template("tenant_dashboard.html", properties=found, filters=filters, bookings=my_bookings)
@@ -386,23 +731,27 @@ def property_details(property_id):
     if not is_logged_in() or not role_is("tenant"):
         return redirect(url_for("login"))
 
-    prop = props_col.find_one({"_id": ObjectId(property_id)})
+    oid = ObjectId(property_id)
+    tenant_email = session["user_email"]
+    prop, approved, existing = run_parallel(
+        lambda: props_col.find_one({"_id": oid}),
+        # booking state for this property
+        lambda: bookings_col.find_one({"property_id": oid, "status": "APPROVED"}, {"tenant_email": 1}),
+        # whether current tenant already has a pending/approved booking
+        lambda: bookings_col.find_one({"property_id": oid, "tenant_email": tenant_email}, {"status": 1})
+    )
     if not prop:
         return redirect(url_for("tenant_dashboard"))
 
     prop["_id"] = str(prop["_id"])
     prop["images"] = prop.get("images", [])
     prop["reviews"] = prop.get("reviews", [])
-    prop["avg_rating"] = compute_avg_rating(prop["reviews"])
+    prop["avg_rating"] = stored_avg_rating(prop)
+    prop["review_count"] = stored_review_count(prop)
     prop["map_url"] = "https://www.google.com/maps/search/?api=1&query=" + quote_plus(prop.get("location", "")) if prop.get("location") else "#"
 
-    # booking state for this property
-    approved = bookings_col.find_one({"property_id": ObjectId(prop["_id"]), "status": "APPROVED"})
     prop["booked"] = bool(approved)
     prop["booked_by"] = approved["tenant_email"] if approved else None
-
-    # whether current tenant already has a pending/approved booking
-    existing = bookings_col.find_one({"property_id": ObjectId(prop["_id"]), "tenant_email": session["user_email"]})
     prop["my_booking"] = existing
 
     return render_template("property_details.html", property=prop)
@@ -415,21 +764,25 @@ def book_property(property_id):
     if not is_logged_in() or not role_is("tenant"):
         return redirect(url_for("login"))
 
-    # verify property exists
+    # verify property exists (and load the tenant alongside it)
+    tenant_email = session["user_email"]
     try:
-        prop = props_col.find_one({"_id": ObjectId(property_id)})
+        oid = ObjectId(property_id)
+        prop, tenant = run_parallel(
+            lambda: props_col.find_one({"_id": oid}),
+            lambda: users_col.find_one({"email": tenant_email}, {"name": 1})
+        )
     except Exception:
-        prop = None
+        prop, tenant = None, None
     if not prop:
         flash("Property not found.", "danger")
         return redirect(url_for("tenant_dashboard"))
 
-    tenant = users_col.find_one({"email": session["user_email"]})
     tenant_name = tenant.get("name", session["user_email"]) if tenant else session["user_email"]
 
     # create booking with status PENDING
     booking_doc = {
-        "property_id": ObjectId(property_id),
+        "property_id": oid,
         "tenant_email": session["user_email"],
         "tenant_name": tenant_name,
         "created_at": datetime.utcnow(),
@@ -440,7 +793,8 @@ def book_property(property_id):
     # create a notification for the owner
     notif = {
         "owner_email": prop["owner_email"],
-        "property_id": ObjectId(property_id),
+        "for_email": recipients(prop["owner_email"]),
+        "property_id": oid,
         "message": f"New booking request from {tenant_name} ({session['user_email']}) for '{prop.get('title', 'Property')}'",
         "timestamp": datetime.utcnow(),
         "read": False
@@ -448,10 +802,10 @@ def book_property(property_id):
     notifications_col.insert_one(notif)
 
     # Send email to owner (non-blocking best-effort)
-    owner = users_col.find_one({"email": prop["owner_email"]})
+    owner = users_col.find_one({"email": prop["owner_email"]}, {"name": 1, "email": 1})
     if owner and owner.get("email"):
         try:
-            send_email(
+            send_email_async(
                 to_email=owner["email"],
                 subject=f"New booking request for '{prop.get('title', 'Property')}'",
                 body=f"Hello {owner.get('name','')},\n\nYou have a new booking request from {tenant_name} ({session['user_email']}) for your property '{prop.get('title','Property')}'.\n\nLog in to the dashboard to approve or reject the request.\n\nThanks,\nRental App"
@@ -467,18 +821,22 @@ def book_property(property_id):
 def my_bookings():
     if not is_logged_in() or not role_is("tenant"):
         return redirect(url_for("login"))
-    my_bookings = list(bookings_col.find({"tenant_email": session["user_email"]}).sort("created_at", -1))
-    # enrich with property title
+    my_bookings = list(bookings_col.find(
+        {"tenant_email": session["user_email"]}, {"property_id": 1, "status": 1, "created_at": 1}
+    ).sort("created_at", -1))
+    # enrich with property title (one query for all bookings)
+    ids = list({b["property_id"] for b in my_bookings if b.get("property_id")})
+    try:
+        titles = {p["_id"]: p.get("title") for p in props_col.find({"_id": {"$in": ids}}, {"title": 1})}
+    except Exception:
+        titles = None
     for b in my_bookings:
         b["_id"] = str(b["_id"])
-        b["created_at_str"] = b["created_at"].strftime("%Y-%m-%d %H:%M")
-        try:
-            p = props_col.find_one({"_id": b["property_id"]})
-            b["property_title"] = p.get("title") if p else "Deleted property"
-            b["property_id_str"] = str(b["property_id"])
-        except Exception:
+        b["property_id_str"] = str(b.get("property_id", ""))
+        if titles is None:
             b["property_title"] = "Unknown"
-            b["property_id_str"] = str(b.get("property_id", ""))
+        else:
+            b["property_title"] = titles.get(b.get("property_id"), "Deleted property")
     return render_template("my_bookings.html", bookings=my_bookings)
 
 
@@ -490,12 +848,16 @@ def owner_requests(property_id):
         return redirect(url_for("login"))
 
     # ensure owner owns the property
-    prop = props_col.find_one({"_id": ObjectId(property_id), "owner_email": session["user_email"]})
+    oid = ObjectId(property_id)
+    prop = props_col.find_one({"_id": oid, "owner_email": session["user_email"]}, {"title": 1})
     if not prop:
         flash("Property not found or you are not the owner.", "danger")
         return redirect(url_for("owner_dashboard"))
 
-    reqs = list(bookings_col.find({"property_id": ObjectId(property_id)}).sort("created_at", 1))
+    reqs = list(bookings_col.find(
+        {"property_id": oid},
+        {"tenant_name": 1, "tenant_email": 1, "status": 1, "created_at": 1}
+    ).sort("created_at", 1))
     requests_list = []
     for r in reqs:
         requests_list.append({
@@ -503,7 +865,7 @@ def owner_requests(property_id):
             "tenant_name": r.get("tenant_name"),
             "tenant_email": r.get("tenant_email"),
             "status": r.get("status"),
-            "created_at": r.get("created_at").strftime("%Y-%m-%d %H:%M")
+            "created_at": r.get("created_at")
         })
 
     return render_template("owner_property_requests.html", requests=requests_list, property_title=prop.get("title", "Property"))
@@ -520,33 +882,36 @@ def owner_approve_request(booking_id):
         return redirect(url_for("owner_dashboard"))
 
     # verify owner owns the property
-    prop = props_col.find_one({"_id": booking["property_id"], "owner_email": session["user_email"]})
+    prop = props_col.find_one({"_id": booking["property_id"], "owner_email": session["user_email"]}, {"title": 1})
     if not prop:
         flash("You are not authorized to approve this booking.", "danger")
         return redirect(url_for("owner_dashboard"))
 
     # check if already an approved booking exists
-    existing_approved = bookings_col.find_one({"property_id": booking["property_id"], "status": "APPROVED"})
+    existing_approved = bookings_col.find_one({"property_id": booking["property_id"], "status": "APPROVED"}, {"_id": 1})
     if existing_approved:
         flash("This property is already booked by someone else.", "warning")
         return redirect(url_for("owner_requests", property_id=str(booking["property_id"])))
 
-    # Approve this booking
-    bookings_col.update_one({"_id": booking["_id"]}, {"$set": {"status": "APPROVED"}})
+    # Approve this booking and auto-reject all other pending bookings
+    # for the same property in a single round-trip
+    bookings_col.bulk_write([
+        UpdateOne({"_id": booking["_id"]}, {"$set": {"status": "APPROVED"}}),
+        UpdateMany(
+            {"property_id": booking["property_id"], "status": "PENDING", "_id": {"$ne": booking["_id"]}},
+            {"$set": {"status": "REJECTED"}}
+        )
+    ], ordered=False)
 
     # Mark property as booked (simple flag)
     props_col.update_one({"_id": booking["property_id"]}, {"$set": {"booked": True, "booked_by": booking["tenant_email"]}})
-
-    # Auto-reject all other pending bookings for the same property
-    bookings_col.update_many(
-        {"property_id": booking["property_id"], "status": "PENDING", "_id": {"$ne": booking["_id"]}},
-        {"$set": {"status": "REJECTED"}}
-    )
+    invalidate_search_cache()
 
     # Notify tenant (in-app)
     notifications_col.insert_one({
         "owner_email": session["user_email"],
         "tenant_email": booking["tenant_email"],
+        "for_email": recipients(session["user_email"], booking["tenant_email"]),
         "property_id": booking["property_id"],
         "booking_id": booking["_id"],
         "message": f"Your booking for '{prop.get('title', 'Property')}' has been APPROVED by the owner.",
@@ -556,7 +921,7 @@ def owner_approve_request(booking_id):
 
     # Send email to tenant
     try:
-        send_email(
+        send_email_async(
             to_email=booking["tenant_email"],
             subject=f"Your booking for '{prop.get('title', 'Property')}' is APPROVED",
             body=f"Hello {booking.get('tenant_name','')},\n\nYour booking for the property '{prop.get('title','Property')}' has been APPROVED by the owner ({session['user_email']}).\n\nPlease contact the owner to finalize details.\n\nThanks,\nRental App"
@@ -579,7 +944,7 @@ def owner_reject_request(booking_id):
         return redirect(url_for("owner_dashboard"))
 
     # verify owner owns the property
-    prop = props_col.find_one({"_id": booking["property_id"], "owner_email": session["user_email"]})
+    prop = props_col.find_one({"_id": booking["property_id"], "owner_email": session["user_email"]}, {"title": 1})
     if not prop:
         flash("You are not authorized to reject this booking.", "danger")
         return redirect(url_for("owner_dashboard"))
@@ -590,6 +955,7 @@ def owner_reject_request(booking_id):
     notifications_col.insert_one({
         "owner_email": session["user_email"],
         "tenant_email": booking["tenant_email"],
+        "for_email": recipients(session["user_email"], booking["tenant_email"]),
         "property_id": booking["property_id"],
         "booking_id": booking["_id"],
         "message": f"Your booking for '{prop.get('title', 'Property')}' has been REJECTED by the owner.",
@@ -599,7 +965,7 @@ def owner_reject_request(booking_id):
 
     # Send email to tenant
     try:
-        send_email(
+        send_email_async(
             to_email=booking["tenant_email"],
             subject=f"Your booking for '{prop.get('title', 'Property')}' was REJECTED",
             body=f"Hello {booking.get('tenant_name','')},\n\nYour booking for the property '{prop.get('title','Property')}' has been rejected by the owner ({session['user_email']}).\n\nYou can try other listings.\n\nThanks,\nRental App"
@@ -621,12 +987,17 @@ def notifications():
     user_email = session["user_email"]
     role = session.get("role")
     # show notifications relevant to the user (owner or tenant)
-    query = {"$or": [{"owner_email": user_email}, {"tenant_email": user_email}]}
-    notifs = list(notifications_col.find(query).sort("timestamp", -1))
-    for n in notifs:
-        n["_id"] = str(n["_id"])
-        n["timestamp_str"] = n["timestamp"].strftime("%Y-%m-%d %H:%M")
-    return render_template("notifications.html", notifications=notifs)
+    query = {"for_email": user_email}
+    cursor = notifications_col.find(
+        query, {"message": 1, "timestamp": 1, "read": 1}
+    ).sort("timestamp", -1).limit(50)
+
+    def iter_notifs():
+        for n in cursor:
+            n["_id"] = str(n["_id"])
+            yield n
+
+    return app.response_class(stream_template("notifications.html", notifications=iter_notifs()))
 
 
 @app.route("/notifications/read/<notif_id>", methods=["POST"])
@@ -658,7 +1029,7 @@ def add_review(property_id):
         # invalid rating -> redirect back silently
         return redirect(url_for("property_details", property_id=property_id))
 
-    reviewer = users_col.find_one({"email": session.get("user_email")})
+    reviewer = users_col.find_one({"email": session.get("user_email")}, {"name": 1})
     reviewer_name = reviewer.get("name") if reviewer and reviewer.get("name") else session.get("user_email")
 
     review_doc = {
@@ -670,7 +1041,16 @@ def add_review(property_id):
     }
 
     try:
-        props_col.update_one({"_id": ObjectId(property_id)}, {"$push": {"reviews": review_doc}})
+        # append the review and refresh the cached rating in one atomic update;
+        # $literal keeps user text starting with "$" from being read as a field path
+        props_col.update_one({"_id": ObjectId(property_id)}, [
+            {"$set": {"reviews": {"$concatArrays": [{"$ifNull": ["$reviews", []]}, [{"$literal": review_doc}]]}}},
+            {"$set": {
+                "avg_rating": {"$round": [{"$avg": "$reviews.rating"}, 2]},
+                "review_count": {"$size": "$reviews"}
+            }}
+        ])
+        invalidate_search_cache()
     except Exception:
         pass
 
@@ -693,22 +1073,27 @@ def generate_fake_props(count=3):
     ]
 
     count = max(1, min(20, count))
-    for i in range(count):
-        loc = random.choice(sample_locations)
-        props_col.insert_one({
-            "title": f"Sample Flat {random.randint(100,999)}",
-            "description": "Auto-generated sample listing for development/testing.",
-            "location": loc,
-            "latitude": None,
-            "longitude": None,
-            "price": round(random.uniform(5000, 50000), 2),
-            "rooms": random.randint(1, 5),
-            "owner_email": session["user_email"],
-            "images": [],
-            "reviews": [],
-            "fake": True,
-            "created_at": datetime.utcnow()
-        })
+    locations = [random.choice(sample_locations) for _ in range(count)]
+    coords = get_lat_lon_batch(locations)
+    docs = [{
+        "title": f"Sample Flat {random.randint(100,999)}",
+        "description": "Auto-generated sample listing for development/testing.",
+        "location": loc,
+        "location_tokens": location_tokens(loc),
+        "latitude": lat,
+        "longitude": lon,
+        "price": round(random.uniform(5000, 50000), 2),
+        "rooms": random.randint(1, 5),
+        "owner_email": session["user_email"],
+        "images": [],
+        "reviews": [],
+        "avg_rating": None,
+        "review_count": 0,
+        "fake": True,
+        "created_at": datetime.utcnow()
+    } for loc, (lat, lon) in zip(locations, coords)]
+    props_col.insert_many(docs, ordered=False)
+    invalidate_search_cache()
 
     return redirect(url_for("owner_dashboard"))
 
@@ -718,9 +1103,48 @@ def clear_fake_props():
     if not is_logged_in() or not role_is("owner"):
         return redirect(url_for("login"))
     props_col.delete_many({"fake": True, "owner_email": session["user_email"]})
+    invalidate_search_cache()
     return redirect(url_for("owner_dashboard"))
 
 
+# ------------------ MAINTENANCE ------------------
+
+# Maintenance tasks run as CLI commands (e.g. `flask ensure-indexes`) rather than
+# at import, so no Mongo connection is opened before WSGI workers fork.
+
+@app.cli.command("ensure-indexes")
+def ensure_indexes():
+    """Create indexes for the hot query paths (no-op if they already exist)."""
+    props_col.create_index("owner_email")
+    props_col.create_index("location_tokens")
+    props_col.create_index([("price", 1), ("rooms", 1)])
+    bookings_col.create_index([("property_id", 1), ("status", 1)])
+    bookings_col.create_index([("tenant_email", 1), ("created_at", -1)])
+    notifications_col.create_index([("owner_email", 1), ("timestamp", -1)])
+    notifications_col.create_index([("for_email", 1), ("timestamp", -1)])
+    print("Indexes are in place.")
+
+
+@app.cli.command("backfill-notifications")
+def backfill_notifications():
+    """Populate for_email on notifications created before the field existed."""
+    res = notifications_col.update_many({"for_email": {"$exists": False}}, [
+        {"$set": {"for_email": {"$setDifference": [["$owner_email", "$tenant_email"], [None]]}}}
+    ])
+    print(f"Backfilled {res.modified_count} notifications.")
+
+
+@app.cli.command("backfill-locations")
+def backfill_locations():
+    """Populate location_tokens on properties created before the field existed."""
+    ops = [
+        UpdateOne({"_id": p["_id"]}, {"$set": {"location_tokens": location_tokens(p.get("location"))}})
+        for p in props_col.find({"location_tokens": {"$exists": False}}, {"location": 1})
+    ]
+    modified = props_col.bulk_write(ops, ordered=False).modified_count if ops else 0
+    print(f"Backfilled {modified} properties.")
+
+
 # ------------------ MAIN ------------------
 
 if __name__ == "__main__":